@@ -1,11 +1,13 @@
-from typing import Any, Dict
+import asyncio
+from functools import cache, wraps
+from typing import Any, Callable, Coroutine, Dict, Optional
 
 try:
     from google.adk.agents import Agent  # type: ignore
 except Exception:  # noqa: BLE001
     Agent = None  # type: ignore
 
-from data_agent.nl2sql import nl2sql_and_execute
+from data_agent.nl2sql import nl2sql_and_execute, prefetch_schema_context
 from data_agent.nl2py import run_python_analysis
 from data_agent.bq import list_tables, count_tables, table_row_counts
 from data_agent.utils.log import log_step
@@ -73,6 +75,36 @@ def tool_answer(question: str) -> Dict[str, Any]:
         }
 
 
+def _to_async(fn: Callable[..., Dict[str, Any]]) -> Callable[..., Coroutine[Any, Any, Dict[str, Any]]]:
+    # Keep name/docstring/signature so ADK declares the same tool, but run the blocking
+    # BigQuery/Vertex work on a worker thread instead of the event loop.
+    @wraps(fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    return wrapper
+
+
+@cache
+def _prefetch_schema_once() -> Any:
+    return prefetch_schema_context()
+
+
+def _warm_schema_cache(callback_context: Any) -> Optional[Any]:
+    # Runs when the served agent handles its first turn (never on import, so the CLI
+    # doesn't pay for it); the schema loads while the model plans its tool call.
+    _prefetch_schema_once()
+    return None
+
+
+tool_answer_async = _to_async(tool_answer)
+tool_nl2sql_async = _to_async(tool_nl2sql)
+tool_nl2py_async = _to_async(tool_nl2py)
+tool_list_tables_async = _to_async(tool_list_tables)
+tool_count_tables_async = _to_async(tool_count_tables)
+tool_table_row_counts_async = _to_async(tool_table_row_counts)
+
+
 if Agent is not None:
     root_agent = Agent(
         name="data_agent",
@@ -85,7 +117,15 @@ if Agent is not None:
             "Show a short step list of what you are doing (intent, SQL, dry-run, execute). "
             "You can still call NL2SQL or NL2Py directly for advanced cases, but prefer the answer tool."
         ),
-        tools=[tool_answer, tool_nl2sql, tool_nl2py, tool_list_tables, tool_count_tables, tool_table_row_counts],
+        tools=[
+            tool_answer_async,
+            tool_nl2sql_async,
+            tool_nl2py_async,
+            tool_list_tables_async,
+            tool_count_tables_async,
+            tool_table_row_counts_async,
+        ],
+        before_agent_callback=_warm_schema_cache,
     )
 else:
     # Fallback stub so imports don't fail in environments without ADK
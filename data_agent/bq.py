@@ -1,11 +1,51 @@
-from typing import Any, Dict, List, Optional
+import io
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
 
 from google.cloud import bigquery
 
-from data_agent.config import BQ_PROJECT, BQ_LOCATION, BQ_DATASET, ALLOW_CROSS_DATASET
+from data_agent.config import (
+    BQ_PROJECT,
+    BQ_LOCATION,
+    BQ_DATASET,
+    ALLOW_CROSS_DATASET,
+    BQ_COUNT_CONCURRENCY,
+    SCHEMA_CACHE_TTL,
+)
+from data_agent.utils.cache import TTLCache
 from data_agent.utils.log import log_step
 
 
+F = TypeVar("F", bound=Callable[..., Any])
+
+_schema_cache = TTLCache(maxsize=32, ttl=SCHEMA_CACHE_TTL)
+
+
+def _schema_cached(fn: F) -> F:
+    """Cache successful INFORMATION_SCHEMA lookups per (project, dataset, args)."""
+
+    @wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        key = (BQ_PROJECT, BQ_DATASET, fn.__name__, args, tuple(sorted(kwargs.items())))
+        hit, value = _schema_cache.get(key)
+        if not hit:
+            value = fn(*args, **kwargs)
+            # Never cache failures or empty results so the next call retries.
+            if not value or (isinstance(value, dict) and value.get("status") == "error"):
+                return value
+            _schema_cache.set(key, value)
+        # Callers attach keys like "debug" to result dicts; hand out a shallow copy.
+        return dict(value) if isinstance(value, dict) else value
+
+    return wrapper  # type: ignore[return-value]
+
+
+def invalidate_schema_cache() -> None:
+    _schema_cache.clear()
+
+
 def _ensure_select(sql: str) -> None:
     lowered = (sql or "").strip().lower()
     if not lowered.startswith("select"):
@@ -32,6 +72,65 @@ def _enforce_dataset(sql: str) -> None:
     )
 
 
+@lru_cache(maxsize=8)
+def _get_client(project_id: str) -> bigquery.Client:
+    # Client construction resolves credentials and sets up the HTTP session; reuse it per project.
+    return bigquery.Client(project=project_id)
+
+
+@lru_cache(maxsize=1)
+def _get_bqs() -> Optional[Any]:
+    # Storage Read API client is optional; None means fall back to REST paging.
+    try:
+        from google.cloud import bigquery_storage  # type: ignore
+
+        return bigquery_storage.BigQueryReadClient()
+    except Exception:  # noqa: BLE001
+        return None
+
+
+def materialize(rows_iter: Iterable[Any], n: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Realize at most `n` rows (all when None) from a BigQuery row iterator as dicts."""
+    return [dict(row.items()) for row in islice(rows_iter, n)]
+
+
+# Below this many rows a Storage Read session costs more than paging over REST
+_STORAGE_MIN_ROWS = 10_000
+
+
+def _storage_batches(job: Any, result: Any, n: Optional[int]) -> Optional[List[Any]]:
+    """Read at most `n` rows (all when None) of a large result as Arrow record batches over
+    the Storage Read API; None when the result is small, the API is unavailable or it fails."""
+    total_rows = getattr(result, "total_rows", None)
+    if total_rows is None or min(total_rows, n or total_rows) < _STORAGE_MIN_ROWS:
+        return None
+    bqs = _get_bqs()
+    if bqs is None:
+        return None
+    batches: List[Any] = []
+    try:
+        # A fresh, uncapped iterator: the client ignores the Storage API when max_results is set
+        for batch in job.result().to_arrow_iterable(bqstorage_client=bqs):
+            if n is not None and batch.num_rows >= n:
+                batches.append(batch.slice(0, n))
+                break
+            batches.append(batch)
+            if n is not None:
+                n -= batch.num_rows
+    except Exception as exc:  # noqa: BLE001
+        log_step(f"Storage Read API unavailable, using REST: {exc}")
+        return None
+    return batches or None
+
+
+def _arrow_table(result: Any) -> Optional[Any]:
+    try:
+        return result.to_arrow(create_bqstorage_client=False)
+    except Exception as exc:  # noqa: BLE001
+        log_step(f"Arrow download unavailable, using rows: {exc}")
+        return None
+
+
 def run_query(
     sql: str,
     *,
@@ -40,12 +139,15 @@ def run_query(
     parameters: Optional[Dict[str, Any]] = None,
     maximum_rows: int = 1000,
     dry_run: bool = False,
+    as_arrow: bool = False,
 ) -> Dict[str, Any]:
+    # as_arrow=True returns the result as a pyarrow.Table under "arrow" instead of "rows"
+    # (falls back to "rows" when pyarrow is unavailable).
     _ensure_select(sql)
     log_step("Validating dataset scope and query safety…")
     _enforce_dataset(sql)
 
-    client = bigquery.Client(project=project_id or BQ_PROJECT)
+    client = _get_client(project_id or BQ_PROJECT)
     job_config = bigquery.QueryJobConfig()
 
     if dry_run:
@@ -78,69 +180,95 @@ def run_query(
                 "sql": sql,
             }
         log_step("Waiting for query results…")
-        result = job.result()
-        field_names = [f.name for f in result.schema]
-        rows: List[Dict[str, Any]] = [
-            {k: row[k] for k in field_names} for row in result
-        ]
-        if maximum_rows and maximum_rows > 0:
-            rows = rows[:maximum_rows]
+        # Cap server-side paging so only the requested rows cross the wire.
+        max_results = maximum_rows if maximum_rows and maximum_rows > 0 else None
+        result = job.result(max_results=max_results)
+        rows: Optional[List[Dict[str, Any]]] = None
+        arrow_tbl: Optional[Any] = None
+        # Large results stream over the Storage Read API, stopping after max_results rows;
+        # `result` stays unread, so it is still usable if that path is skipped or fails.
+        batches = _storage_batches(job, result, max_results)
+        if batches is not None:
+            if as_arrow:
+                import pyarrow as pa  # local import; to_arrow_iterable already needed it
+
+                arrow_tbl = pa.Table.from_batches(batches)
+            else:
+                rows = [row for batch in batches for row in batch.to_pylist()]
+        elif as_arrow:
+            arrow_tbl = _arrow_table(result)
+            if arrow_tbl is None:
+                # A failed download may have consumed the iterator; re-read the job's results.
+                result = job.result(max_results=max_results)
+        if arrow_tbl is None and rows is None:
+            rows = materialize(result, max_results)
         schema = [
             {"name": f.name, "type": f.field_type, "mode": getattr(f, "mode", None)}
             for f in result.schema
         ]
         log_step("Query succeeded.")
-        return {
-            "status": "success",
-            "rows": rows,
-            "num_rows": len(rows),
-            "schema": schema,
-            "job_id": job.job_id,
-            "sql": sql,
-        }
+        out: Dict[str, Any] = {"status": "success"}
+        if arrow_tbl is not None:
+            out.update({"arrow": arrow_tbl, "num_rows": arrow_tbl.num_rows})
+        else:
+            out.update({"rows": rows, "num_rows": len(rows)})
+        out.update({"schema": schema, "job_id": job.job_id, "sql": sql})
+        return out
     except Exception as exc:  # noqa: BLE001
         log_step(f"Query failed: {exc}")
         return {"status": "error", "error_message": str(exc), "sql": sql}
 
 
+@_schema_cached
 def get_schema_summary(max_tables: int = 25, max_columns_per_table: int = 30) -> str:
-    # Build a compact schema context from INFORMATION_SCHEMA
+    # Build a compact schema context from INFORMATION_SCHEMA. Fetch one column past the
+    # per-table cap so truncation can still be marked with "...".
     sql = f"""
     SELECT table_name, column_name, data_type
     FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.COLUMNS
+    WHERE TRUE
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY table_name ORDER BY ordinal_position) <= {int(max_columns_per_table) + 1}
     ORDER BY table_name, ordinal_position
     """
-    res = run_query(sql)
+    res = run_query(sql, maximum_rows=(max_tables + 1) * (max_columns_per_table + 1))
     if res.get("status") != "success":
         return ""
-    rows = res.get("rows", [])
-    # Aggregate by table
-    table_to_cols: Dict[str, List[str]] = {}
-    for r in rows:
-        table_to_cols.setdefault(r["table_name"], []).append(
-            f"{r['column_name']}:{r['data_type']}"
-        )
+    # Aggregate by table, stopping as soon as the limits are reached
     parts: List[str] = []
-    for idx, (tbl, cols) in enumerate(table_to_cols.items()):
-        if idx >= max_tables:
-            parts.append("...")
-            break
-        if len(cols) > max_columns_per_table:
-            cols = cols[:max_columns_per_table] + ["..."]
-        parts.append(f"{tbl} -> " + ", ".join(cols))
+    current_table: Optional[str] = None
+    current_cols: List[str] = []
+    for r in res.get("rows", []):
+        tbl = r["table_name"]
+        if tbl != current_table:
+            if current_table is not None:
+                parts.append(f"{current_table} -> " + ", ".join(current_cols))
+            if len(parts) >= max_tables:
+                parts.append("...")
+                current_table = None
+                break
+            current_table, current_cols = tbl, []
+        if len(current_cols) < max_columns_per_table:
+            current_cols.append(f"{r['column_name']}:{r['data_type']}")
+        elif current_cols[-1:] != ["..."]:
+            current_cols.append("...")
+    if current_table is not None:
+        parts.append(f"{current_table} -> " + ", ".join(current_cols))
     return "\n".join(parts)
 
 
+@_schema_cached
 def list_tables() -> Dict[str, Any]:
     sql = f"SELECT table_name FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.TABLES ORDER BY table_name"
     return run_query(sql)
 
 
+@_schema_cached
 def count_tables() -> Dict[str, Any]:
     sql = f"SELECT COUNT(*) AS table_count FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.TABLES"
     return run_query(sql)
 
 
+@_schema_cached
 def get_tables_and_columns(max_tables: int = 200, max_cols: int = 60) -> Dict[str, List[Dict[str, Any]]]:
     """Return mapping: table_name -> list of {column_name, data_type}.
 
@@ -167,33 +295,91 @@ def get_tables_and_columns(max_tables: int = 200, max_cols: int = 60) -> Dict[st
     return out
 
 
+@_schema_cached
+def get_schema_prompt_string(max_tables: int = 200, max_cols: int = 60) -> str:
+    """Render `table -> col:type, ...` lines for prompts in one pass over the rows.
+
+    Same limits as get_tables_and_columns, without building the intermediate mapping.
+    """
+    sql = f"""
+    SELECT table_name, column_name, data_type
+    FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.COLUMNS
+    ORDER BY table_name, ordinal_position
+    """
+    res = run_query(sql)
+    if res.get("status") != "success":
+        return ""
+    buf = io.StringIO()
+    current_table = None
+    n_tables = 0
+    n_cols = 0
+    for r in res.get("rows", []):
+        t = r["table_name"]
+        if t != current_table:
+            if n_tables >= max_tables:
+                break
+            if current_table is not None:
+                buf.write("\n")
+            buf.write(f"{t} -> ")
+            current_table = t
+            n_tables += 1
+            n_cols = 0
+        if n_cols < max_cols:
+            if n_cols:
+                buf.write(", ")
+            buf.write(f"{r['column_name']}:{r['data_type']}")
+            n_cols += 1
+    return buf.getvalue()
+
+
 def table_row_counts() -> Dict[str, Any]:
     """Return row counts per table with fallbacks, and include debug attempts."""
     attempts: List[Dict[str, Any]] = []
 
-    # Attempt 1: TABLE_STORAGE (provides row_count for most tables)
+    # Attempt 1: TABLE_STORAGE (most tables) and PARTITIONS (partitioned tables) in one round-trip
     sql1 = (
-        f"SELECT table_name, row_count FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.TABLE_STORAGE "
-        "ORDER BY table_name"
+        f"SELECT 'storage' AS src, table_name, row_count "
+        f"FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.TABLE_STORAGE "
+        "UNION ALL "
+        f"SELECT 'partitions' AS src, table_name, SUM(row_count) AS row_count "
+        f"FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.PARTITIONS GROUP BY table_name"
     )
-    log_step("Row counts attempt #1: INFORMATION_SCHEMA.TABLE_STORAGE …")
-    res1 = run_query(sql1)
+    log_step("Row counts attempt #1: INFORMATION_SCHEMA.TABLE_STORAGE + PARTITIONS …")
+    res1 = run_query(sql1, maximum_rows=0)
     attempts.append({"sql": sql1, "status": res1.get("status"), "error": res1.get("error_message")})
     if res1.get("status") == "success" and res1.get("rows"):
+        # Prefer TABLE_STORAGE counts; PARTITIONS only fills in tables it lacks
+        counts: Dict[str, Any] = {}
+        for r in res1["rows"]:
+            if r["src"] == "storage" or r["table_name"] not in counts:
+                counts[r["table_name"]] = r["row_count"]
+        res1["rows"] = [{"table_name": t, "row_count": counts[t]} for t in sorted(counts)]
+        res1["num_rows"] = len(res1["rows"])
+        res1["schema"] = [f for f in res1.get("schema", []) if f["name"] != "src"]
         res1["debug"] = {"attempts": attempts}
         return res1
 
-    # Attempt 2: PARTITIONS (partitioned tables)
-    sql2 = (
-        f"SELECT table_name, SUM(row_count) AS row_count FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.PARTITIONS "
-        "GROUP BY table_name ORDER BY table_name"
-    )
-    log_step("Row counts attempt #2: INFORMATION_SCHEMA.PARTITIONS …")
-    res2 = run_query(sql2)
-    attempts.append({"sql": sql2, "status": res2.get("status"), "error": res2.get("error_message")})
-    if res2.get("status") == "success" and res2.get("rows"):
-        res2["debug"] = {"attempts": attempts}
-        return res2
+    # Attempt 2: each view on its own, since either one can make the combined query fail
+    if res1.get("status") != "success":
+        single_view_sqls = [
+            (
+                "TABLE_STORAGE",
+                f"SELECT table_name, row_count FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.TABLE_STORAGE "
+                "ORDER BY table_name",
+            ),
+            (
+                "PARTITIONS",
+                f"SELECT table_name, SUM(row_count) AS row_count FROM `{BQ_PROJECT}.{BQ_DATASET}`.INFORMATION_SCHEMA.PARTITIONS "
+                "GROUP BY table_name ORDER BY table_name",
+            ),
+        ]
+        for view, sql2 in single_view_sqls:
+            log_step(f"Row counts attempt #2: INFORMATION_SCHEMA.{view} …")
+            res2 = run_query(sql2, maximum_rows=0)
+            attempts.append({"sql": sql2, "status": res2.get("status"), "error": res2.get("error_message")})
+            if res2.get("status") == "success" and res2.get("rows"):
+                res2["debug"] = {"attempts": attempts}
+                return res2
 
     # Attempt 3: Iterate COUNT(*) for each table (may be slower/costly)
     log_step("Row counts attempt #3: enumerate tables and COUNT(*) …")
@@ -202,16 +388,17 @@ def table_row_counts() -> Dict[str, Any]:
     if lt.get("status") != "success" or not lt.get("rows"):
         return {"status": "error", "error_message": lt.get("error_message", "Failed to list tables"), "debug": {"attempts": attempts}}
 
+    tables = [r.get("table_name") for r in lt.get("rows", []) if r.get("table_name")]
+    sqls = [f"SELECT COUNT(*) AS row_count FROM `{BQ_PROJECT}.{BQ_DATASET}.{t}`" for t in tables]
     rows_out: List[Dict[str, Any]] = []
-    for r in lt.get("rows", []):
-        t = r.get("table_name")
-        if not t:
-            continue
-        sql3 = f"SELECT COUNT(*) AS row_count FROM `{BQ_PROJECT}.{BQ_DATASET}.{t}`"
-        r3 = run_query(sql3)
-        attempts.append({"sql": sql3, "status": r3.get("status"), "error": r3.get("error_message")})
-        if r3.get("status") == "success" and r3.get("rows"):
-            rows_out.append({"table_name": t, "row_count": r3["rows"][0]["row_count"]})
+    if sqls:
+        # Queries are independent and I/O bound; map() keeps results in table order.
+        with ThreadPoolExecutor(max_workers=min(BQ_COUNT_CONCURRENCY, len(sqls))) as ex:
+            results = list(ex.map(run_query, sqls))
+        for t, sql3, r3 in zip(tables, sqls, results):
+            attempts.append({"sql": sql3, "status": r3.get("status"), "error": r3.get("error_message")})
+            if r3.get("status") == "success" and r3.get("rows"):
+                rows_out.append({"table_name": t, "row_count": r3["rows"][0]["row_count"]})
 
     return {
         "status": "success",
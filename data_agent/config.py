@@ -22,6 +22,12 @@ BQ_LOCATION = get_env("BQ_LOCATION", "US")
 # Optional allow cross-dataset queries (default False)
 ALLOW_CROSS_DATASET = get_env("ALLOW_CROSS_DATASET", "false").lower() in {"1", "true", "yes", "on"}
 
+# Max concurrent per-table COUNT(*) queries in the row-count fallback
+BQ_COUNT_CONCURRENCY = max(1, int(get_env("BQ_COUNT_CONCURRENCY", "16")))
+
+# Seconds to reuse INFORMATION_SCHEMA lookups (table lists, schema context)
+SCHEMA_CACHE_TTL = float(get_env("SCHEMA_CACHE_TTL", "300"))
+
 # NL2SQL generation settings
 GEN_TEMPERATURE = float(get_env("GEN_TEMPERATURE", "0.2"))
 GEN_MAX_TOKENS = int(get_env("GEN_MAX_TOKENS", "1024"))
@@ -33,4 +39,13 @@ VERTEX_PROJECT = get_env("VERTEX_PROJECT", BQ_PROJECT)
 VERTEX_LOCATION = get_env("VERTEX_LOCATION", "us-central1")
 VERTEX_MODEL_NAME = get_env("VERTEX_MODEL_NAME", "gemini-1.5-flash")
 
+# Optional semantic cache for NL2SQL: reuse SQL generated for near-duplicate questions
+NL2SQL_SEMANTIC_CACHE = get_env("NL2SQL_SEMANTIC_CACHE", "0").lower() in {"1", "true", "yes", "on"}
+NL2SQL_SEMANTIC_THRESHOLD = float(get_env("NL2SQL_SEMANTIC_THRESHOLD", "0.92"))
+NL2SQL_SEMANTIC_TTL = float(get_env("NL2SQL_SEMANTIC_TTL", "3600"))
+NL2SQL_EMBEDDING_MODEL = get_env("NL2SQL_EMBEDDING_MODEL", "textembedding-gecko@003")
+
+# Wall-clock budget (seconds) for generated Python analysis code; 0 disables
+NL2PY_TIME_BUDGET = float(get_env("NL2PY_TIME_BUDGET", "30"))
+
 
@@ -1,10 +1,30 @@
 import argparse
 import json
+from typing import Any
 
 from data_agent.nl2sql import nl2sql_and_execute
 from data_agent.nl2py import run_python_analysis
 from data_agent.bq import list_tables, count_tables, table_row_counts
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def _dump(obj: Any) -> str:
+    # orjson is optional and faster. Its output differs slightly from json's: datetimes
+    # come out as ISO 8601 ("T" separator) instead of str(), and integers beyond 64 bits
+    # raise, so those fall back to json.
+    if orjson is not None:
+        try:
+            return orjson.dumps(
+                obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS, default=str
+            ).decode()
+        except orjson.JSONEncodeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=str)
+
 
 def main() -> None:
     parser = argparse.ArgumentParser("data_agent entrypoint")
@@ -26,27 +46,27 @@ def main() -> None:
 
     if args.cmd == "nl2sql":
         res = nl2sql_and_execute(args.question, maximum_rows=args.max_rows)
-        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+        print(_dump(res))
         return
 
     if args.cmd == "nl2py":
         res = run_python_analysis(args.question, limit=args.limit)
-        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+        print(_dump(res))
         return
 
     if args.cmd == "tables":
         res = list_tables()
-        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+        print(_dump(res))
         return
 
     if args.cmd == "tables-count":
         res = count_tables()
-        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+        print(_dump(res))
         return
 
     if args.cmd == "table-rows":
         res = table_row_counts()
-        print(json.dumps(res, ensure_ascii=False, indent=2, default=str))
+        print(_dump(res))
         return
 
 
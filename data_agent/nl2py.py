@@ -1,14 +1,144 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
+import ast
+import ctypes
+import hashlib
 import json
+import threading
+from types import CodeType
 
-from data_agent.bq import run_query
-from data_agent.config import BQ_PROJECT, BQ_DATASET
+from data_agent.bq import get_tables_and_columns, run_query
+from data_agent.config import BQ_PROJECT, BQ_DATASET, NL2PY_TIME_BUDGET, VERTEX_MODEL_NAME
+from data_agent.utils.cache import TTLCache
+from data_agent.utils.text import extract_code_block
+from data_agent.utils.vertex import get_gen_model
 
+_CODE_FILENAME = "<nl2py>"
+_compile_cache = TTLCache(maxsize=256)
+# How often a timed-out analysis thread is re-sent TimeoutError until it exits
+_REAP_INTERVAL = 0.2
 
-def _safe_exec_python(code: str, data: list[dict]) -> Dict[str, Any]:
+
+def _compile_cached(code: str) -> CodeType:
+    key = hashlib.blake2b(code.encode("utf-8"), digest_size=16).digest()
+    hit, code_obj = _compile_cache.get(key)
+    if not hit:
+        code_obj = compile(code, _CODE_FILENAME, "exec")
+        _compile_cache.set(key, code_obj)
+    return code_obj
+
+
+def _raise_in_thread(thread: threading.Thread, exc_type: type) -> None:
+    ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread.ident), ctypes.py_object(exc_type))
+
+
+def _reap(thread: threading.Thread) -> None:
+    # A bare `except:` in generated code swallows a single TimeoutError, so keep
+    # re-sending it until one lands outside the try block and the thread exits.
+    while thread.is_alive():
+        _raise_in_thread(thread, TimeoutError)
+        thread.join(_REAP_INTERVAL)
+
+
+def _subscript_columns(node: ast.AST) -> Optional[List[str]]:
+    """Constant column names in a df[...] subscript, or None for anything else."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, (ast.List, ast.Tuple)) and all(
+        isinstance(elt, ast.Constant) and isinstance(elt.value, str) for elt in node.elts
+    ):
+        return [elt.value for elt in node.elts]
+    return None
+
+
+def _referenced_columns(code: str, columns: List[str]) -> List[str]:
+    """Columns of `columns` that `code` reads from df; empty when the full frame is needed.
+
+    Narrowing only happens when every use of `df` is df["col"], df[["a", "b"]] or
+    df.col with a known column that isn't also a DataFrame member; any other use
+    (methods, iteration, aliasing, positional access, rebinding) keeps the full sample.
+    """
+    try:
+        import pandas as pd  # local import
+    except Exception:  # noqa: BLE001
+        return []
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return []
+    known = set(columns)
+    parents: Dict[ast.AST, ast.AST] = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+    used: set[str] = set()
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Name) and node.id == "df"):
+            continue
+        if not isinstance(node.ctx, ast.Load):
+            return []
+        parent = parents.get(node)
+        if isinstance(parent, ast.Attribute):
+            # df.count() / df.values / df.index resolve to DataFrame members, not columns
+            grandparent = parents.get(parent)
+            if (
+                parent.attr not in known
+                or hasattr(pd.DataFrame, parent.attr)
+                or (isinstance(grandparent, ast.Call) and grandparent.func is parent)
+            ):
+                return []
+            used.add(parent.attr)
+        elif isinstance(parent, ast.Subscript) and parent.value is node:
+            names = _subscript_columns(parent.slice)
+            if names is None:
+                return []
+            # New columns assigned by the code (df["x"] = ...) aren't in `known`
+            used.update(n for n in names if n in known)
+        else:
+            return []
+    return [c for c in columns if c in used]
+
+
+def _generate_code(question: str, target_table: str, schema_preview: List[Dict[str, Any]]) -> str:
+    # Try to generate code with a model; otherwise use a basic default
+    try:
+        prompt = (
+            "You are a data analyst. Write a single Python program using pandas (and optionally matplotlib) "
+            "that answers the question in one go. A dataframe `df` holds sample rows from table "
+            f"`{BQ_PROJECT}.{BQ_DATASET}.{target_table}`. If you need other or aggregated data, call "
+            "`run_query(sql)` with a read-only BigQuery SELECT using fully-qualified table names in "
+            f"`{BQ_PROJECT}.{BQ_DATASET}`; it returns a pandas DataFrame. "
+            "Put the final answer in a variable named `result`. "
+            "If you plot, save the figure to a temp path and set `figure_path` to that path. Do not print.\n\n"
+            f"Question: {question}\nSchema: {json.dumps(schema_preview)}\n"
+        )
+        resp = get_gen_model(VERTEX_MODEL_NAME).generate_content(prompt)
+        text = resp.text if hasattr(resp, "text") else str(resp)
+        code = extract_code_block(text, lang="python")
+    except Exception:
+        code = (
+            "# Default analysis: basic column overview\n"
+            "result = {'num_rows': len(df), 'columns': list(df.columns)}\n"
+        )
+    return code
+
+
+def _result_data(res: Dict[str, Any]) -> Any:
+    return res["arrow"] if res.get("arrow") is not None else res.get("rows", [])
+
+
+def _to_dataframe(pd: Any, data: Any) -> Any:
+    # Columnar results convert to pandas without building per-row dicts
+    if hasattr(data, "to_pandas"):
+        return data.to_pandas(split_blocks=True, self_destruct=True)
+    return pd.DataFrame(data)
+
+
+def _safe_exec_python(code: str, data: Any) -> Dict[str, Any]:
     """Execute limited python code with a preloaded dataframe named df.
 
+    `data` is a pyarrow.Table or a list of row dicts.
+
     This is a minimal sandbox; for production, consider stronger isolation.
     """
     try:
@@ -16,12 +146,44 @@ def _safe_exec_python(code: str, data: list[dict]) -> Dict[str, Any]:
     except Exception as exc:  # noqa: BLE001
         return {"status": "error", "error_message": f"pandas missing: {exc}"}
 
-    df = pd.DataFrame(data)
+    def sandbox_run_query(sql: str, maximum_rows: int = 1000) -> Any:
+        # run_query enforces SELECT-only and the dataset guard before touching BigQuery
+        res = run_query(sql, maximum_rows=maximum_rows, as_arrow=True)
+        if res.get("status") != "success":
+            raise RuntimeError(res.get("error_message"))
+        return _to_dataframe(pd, _result_data(res))
+
+    df = _to_dataframe(pd, data)
     safe_builtins = {"len": len, "range": range, "min": min, "max": max, "sum": sum}
-    globals_dict: dict[str, Any] = {"__builtins__": safe_builtins, "pd": pd}
+    globals_dict: dict[str, Any] = {
+        "__builtins__": safe_builtins,
+        "pd": pd,
+        "run_query": sandbox_run_query,
+    }
     locals_dict: dict[str, Any] = {"df": df}
+    outcome: Dict[str, BaseException] = {}
+
+    def run() -> None:
+        try:
+            exec(code_obj, globals_dict, locals_dict)  # noqa: S102
+        except BaseException as exc:  # noqa: BLE001 - reported to the caller below
+            outcome["error"] = exc
+
     try:
-        exec(code, globals_dict, locals_dict)  # noqa: S102
+        code_obj = _compile_cached(code)
+        if NL2PY_TIME_BUDGET > 0:
+            # A watchdog rather than in-thread tracing: the caller gets its answer on time
+            # even if the code is stuck in a C-level pandas call or a run_query round-trip.
+            worker = threading.Thread(target=run, name="nl2py-exec", daemon=True)
+            worker.start()
+            worker.join(NL2PY_TIME_BUDGET)
+            if worker.is_alive():
+                threading.Thread(target=_reap, args=(worker,), name="nl2py-reaper", daemon=True).start()
+                raise TimeoutError(f"analysis exceeded {NL2PY_TIME_BUDGET:g}s time budget")
+        else:
+            run()
+        if "error" in outcome:
+            raise outcome["error"]
         # Convention: analysis result placed in variable `result`
         result = locals_dict.get("result", None)
         # Optional plot saved as path in `figure_path`
@@ -53,37 +215,28 @@ def run_python_analysis(question: str, *, table: str | None = None, limit: int =
             return {"status": "error", "error_message": "Cannot determine a table to sample."}
         target_table = meta["rows"][0]["table_name"]
 
-    # Pull sample rows
-    sample = run_query(f"SELECT * FROM `{BQ_PROJECT}.{BQ_DATASET}.{target_table}` LIMIT {int(limit)}")
-    if sample.get("status") != "success":
-        return sample
-
-    # Try to generate code with a model; otherwise use a basic default
-    try:
-        from vertexai.generative_models import GenerativeModel  # type: ignore
-
-        schema_preview = list(sample.get("schema", []))
-        prompt = (
-            "You are a data analyst. Given a dataframe `df`, write concise Python code using pandas "
-            "(and optionally matplotlib) to answer the question. Put the final answer in a variable named `result`. "
-            "If you plot, save the figure to a temp path and set `figure_path` to that path. Do not print.\n\n"
-            f"Question: {question}\nSchema: {json.dumps(schema_preview)}\n"
+    table_ref = f"`{BQ_PROJECT}.{BQ_DATASET}.{target_table}`"
+    # Prefer the cached schema so the sample can be narrowed to the columns the code uses
+    table_cols = get_tables_and_columns().get(target_table, [])
+    if table_cols:
+        schema_preview = [{"name": c["column_name"], "type": c["data_type"]} for c in table_cols]
+        code = _generate_code(question, target_table, schema_preview)
+        wanted = _referenced_columns(code, [c["column_name"] for c in table_cols])
+        select_list = ", ".join(f"`{c}`" for c in wanted) if wanted else "*"
+        sample = run_query(
+            f"SELECT {select_list} FROM {table_ref} LIMIT {int(limit)}",
+            maximum_rows=int(limit),
+            as_arrow=True,
         )
-        model = GenerativeModel("gemini-1.5-flash")
-        resp = model.generate_content(prompt)
-        text = resp.text if hasattr(resp, "text") else str(resp)
-        code = text
-        if "```" in text:
-            for part in text.split("```"):
-                if "import" in part or "df" in part:
-                    code = part.strip()
-                    break
-    except Exception:
-        code = (
-            "# Default analysis: basic column overview\n"
-            "result = {'num_rows': len(df), 'columns': list(df.columns)}\n"
+        if sample.get("status") != "success":
+            return sample
+    else:
+        # Schema unknown (e.g. beyond the schema cache limits): sample everything first
+        sample = run_query(
+            f"SELECT * FROM {table_ref} LIMIT {int(limit)}", maximum_rows=int(limit), as_arrow=True
         )
+        if sample.get("status") != "success":
+            return sample
+        code = _generate_code(question, target_table, list(sample.get("schema", [])))
 
-    return _safe_exec_python(code, sample.get("rows", []))
-
-
+    return _safe_exec_python(code, _result_data(sample))
@@ -1,27 +1,57 @@
-from typing import Any, Dict
+import hashlib
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from data_agent.config import (
     BQ_PROJECT,
     BQ_DATASET,
     GEN_TEMPERATURE,
     GEN_MAX_TOKENS,
+    NL2SQL_SEMANTIC_CACHE,
+    VERTEX_MODEL_NAME,
 )
 from data_agent.bq import (
     run_query,
     get_schema_summary,
-    get_tables_and_columns,
+    get_schema_prompt_string,
     list_tables,
     count_tables,
     table_row_counts,
 )
+from data_agent.semantic_cache import SemanticSQLCache
+from data_agent.utils.cache import TTLCache
 from data_agent.utils.log import log_step
+from data_agent.utils.text import extract_code_block
+from data_agent.utils.vertex import get_gen_model
+
+
+_semantic_cache = SemanticSQLCache() if NL2SQL_SEMANTIC_CACHE else None
+
+# sha1(sanitized SQL) -> dry-run bytes for SQL that recently passed a dry run
+_validated_sql = TTLCache(maxsize=512, ttl=600)
+
+# Background workers for network calls that can overlap (schema fetch, embedding lookup)
+_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="nl2sql")
+_schema_lock = threading.Lock()
+_schema_future: "Optional[Future[Tuple[str, str]]]" = None
+
+# Intent detection (CN/EN) for meta-queries, checked in order
+_INTENT_PATTERNS: List[Tuple[str, "re.Pattern[str]", Callable[[], Dict[str, Any]]]] = [
+    ("count_tables", re.compile(r"how many tables|count tables|多少表|有多少表"), count_tables),
+    ("list_tables", re.compile(r"list tables|tables list|有哪些表|列出表"), list_tables),
+    ("table_row_counts", re.compile(r"each table|per table|每张表|每个表"), table_row_counts),
+]
+
+
+# Bare table name after FROM/JOIN; skips quoted refs, subqueries and dotted names
+_QUALIFY_RE = re.compile(r"\b(from|join)\s+(?![`(])([A-Za-z_]\w*)\b(?!\.)", re.IGNORECASE)
 
 
 def _generate_sql_with_model(question: str, schema_context: str) -> str:
     try:
         # Prefer Vertex AI GenerativeModel if available
-        from vertexai.generative_models import GenerativeModel  # type: ignore
-
         system = (
             "You translate natural language to BigQuery Standard SQL strictly for the dataset "
             f"`{BQ_PROJECT}.{BQ_DATASET}`. Use fully-qualified table names with backticks. "
@@ -32,8 +62,7 @@ def _generate_sql_with_model(question: str, schema_context: str) -> str:
             f"User question: {question}\n\n"
             "Return only the SQL query in a code block."
         )
-        model = GenerativeModel("gemini-1.5-flash")
-        resp = model.generate_content(
+        resp = get_gen_model(VERTEX_MODEL_NAME).generate_content(
             [system, prompt],
             generation_config={
                 "temperature": GEN_TEMPERATURE,
@@ -48,15 +77,7 @@ def _generate_sql_with_model(question: str, schema_context: str) -> str:
         )
 
     # Extract SQL from a code block if present
-    sql = text
-    if "```" in text:
-        parts = text.split("```")
-        # find first block that looks like SQL
-        for p in parts:
-            if "select" in p.lower():
-                sql = p.strip()
-                break
-    return sql.strip()
+    return extract_code_block(text, lang="sql", contains="select")
 
 
 def _sanitize_sql(sql: str) -> str:
@@ -67,14 +88,9 @@ def _sanitize_sql(sql: str) -> str:
     must = f"`{BQ_PROJECT}.{BQ_DATASET}."
     if must not in sql:
         # naive auto-qualify for patterns: FROM pgduty / JOIN pgduty
-        replacements = {
-            " from ": f" FROM `{BQ_PROJECT}.{BQ_DATASET}.",
-            " join ": f" JOIN `{BQ_PROJECT}.{BQ_DATASET}.",
-        }
-        sql_work = sql
-        for key, val in replacements.items():
-            sql_work = sql_work.replace(key, val)
-            sql_work = sql_work.replace(key.upper(), val)
+        sql_work = _QUALIFY_RE.sub(
+            lambda m: f"{m.group(1).upper()} `{BQ_PROJECT}.{BQ_DATASET}.{m.group(2)}`", sql
+        )
         if must not in sql_work:
             raise ValueError(
                 f"SQL must reference `{BQ_PROJECT}.{BQ_DATASET}` with fully-qualified table names."
@@ -83,39 +99,54 @@ def _sanitize_sql(sql: str) -> str:
     return sql
 
 
+def _build_schema_context() -> Tuple[str, str]:
+    # Richer schema context: table -> columns with types (truncated to keep prompt small)
+    try:
+        schema = get_schema_prompt_string()
+    except Exception:
+        schema = get_schema_summary()
+    return schema, "\n".join(schema.splitlines()[:25])
+
+
+def _schema_context_future() -> "Future[Tuple[str, str]]":
+    """Join the schema build already in flight (e.g. the warm-up) instead of starting a second one."""
+    global _schema_future
+    with _schema_lock:
+        if _schema_future is None or _schema_future.done():
+            _schema_future = _pool.submit(_build_schema_context)
+        return _schema_future
+
+
+def prefetch_schema_context() -> "Future[Tuple[str, str]]":
+    """Warm the schema cache in the background so the first question skips that round-trip."""
+    return _schema_context_future()
+
+
 def nl2sql_and_execute(question: str, *, maximum_rows: int = 100) -> Dict[str, Any]:
     if not question or not isinstance(question, str):
         return {"status": "error", "error_message": "question must be a non-empty string"}
-    # Intent detection (CN/EN) for meta-queries
     q = (question or "").strip().lower()
-    if any(k in q for k in ["how many tables", "count tables", "多少表", "有多少表"]):
-        res = count_tables()
-        res.setdefault("debug", {})["intent"] = "count_tables"
-        return res
-    if any(k in q for k in ["list tables", "tables list", "有哪些表", "列出表"]):
-        res = list_tables()
-        res.setdefault("debug", {})["intent"] = "list_tables"
-        return res
-    if any(k in q for k in ["each table", "per table", "每张表", "每个表"]):
-        res = table_row_counts()
-        res.setdefault("debug", {})["intent"] = "table_row_counts"
-        return res
+    for intent, pattern, handler in _INTENT_PATTERNS:
+        if pattern.search(q):
+            res = handler()
+            res.setdefault("debug", {})["intent"] = intent
+            return res
 
-    # Richer schema context: table -> columns with types (truncated to keep prompt small)
     log_step("Building schema context …")
-    try:
-        toc = get_tables_and_columns()
-        schema = "\n".join(
-            f"{t} -> " + ", ".join(f"{c['column_name']}:{c['data_type']}" for c in cols)
-            for t, cols in list(toc.items())
-        )
-        schema_preview = "\n".join(schema.splitlines()[:25])
-    except Exception:
-        schema = get_schema_summary()
-        schema_preview = "\n".join(schema.splitlines()[:25])
-
-    log_step("Generating SQL from natural language …")
-    generated = _generate_sql_with_model(question, schema)
+    cached_sql, q_embedding = None, None
+    if _semantic_cache is None:
+        schema, schema_preview = _schema_context_future().result()
+    else:
+        # Schema fetch (BigQuery) and embedding lookup (Vertex) are independent; overlap them.
+        f_schema = _schema_context_future()
+        cached_sql, q_embedding = _semantic_cache.lookup(question)
+        schema, schema_preview = f_schema.result()
+    if cached_sql:
+        log_step("Reusing SQL from semantic cache …")
+        generated = cached_sql
+    else:
+        log_step("Generating SQL from natural language …")
+        generated = _generate_sql_with_model(question, schema)
     try:
         log_step("Sanitizing and auto-qualifying SQL …")
         sanitized = _sanitize_sql(generated)
@@ -127,18 +158,32 @@ def nl2sql_and_execute(question: str, *, maximum_rows: int = 100) -> Dict[str, A
             "debug": {"intent": "nl2sql", "schema_preview": schema_preview},
         }
 
-    log_step("Dry running the query …")
-    dry = run_query(sanitized, dry_run=True)
-    if dry.get("status") != "success":
-        return {
-            "status": "error",
-            "error_message": dry.get("error_message"),
-            "sql": sanitized,
-            "debug": {"intent": "nl2sql", "schema_preview": schema_preview},
-        }
+    sql_key = hashlib.sha1(sanitized.encode("utf-8")).hexdigest()
+    validated, dry_run_bytes = _validated_sql.get(sql_key)
+    if validated:
+        log_step("Skipping dry run: SQL validated recently …")
+    else:
+        log_step("Dry running the query …")
+        dry = run_query(sanitized, dry_run=True)
+        if dry.get("status") != "success":
+            return {
+                "status": "error",
+                "error_message": dry.get("error_message"),
+                "sql": sanitized,
+                "debug": {"intent": "nl2sql", "schema_preview": schema_preview},
+            }
+        dry_run_bytes = dry.get("total_bytes_processed")
+        _validated_sql.set(sql_key, dry_run_bytes)
 
     log_step("Executing the query …")
     exec_res = run_query(sanitized, maximum_rows=maximum_rows)
+    if exec_res.get("status") != "success":
+        _validated_sql.pop(sql_key)
+        if _semantic_cache is not None and cached_sql:
+            _semantic_cache.evict_sql(cached_sql)
+    elif _semantic_cache is not None and not cached_sql:
+        # Only SQL that actually ran is offered to similar questions
+        _semantic_cache.store(question, q_embedding, sanitized)
     exec_res.setdefault("debug", {})
     exec_res["debug"].update(
         {
@@ -146,7 +191,9 @@ def nl2sql_and_execute(question: str, *, maximum_rows: int = 100) -> Dict[str, A
             "schema_preview": schema_preview,
             "generated_sql": generated,
             "sanitized_sql": sanitized,
-            "dry_run_bytes": dry.get("total_bytes_processed"),
+            "dry_run_bytes": dry_run_bytes,
+            "dry_run_cached": validated,
+            "semantic_cache_hit": bool(cached_sql),
         }
     )
     log_step("Done.")
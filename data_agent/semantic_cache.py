@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Optional, Tuple
+
+from data_agent.config import (
+    NL2SQL_EMBEDDING_MODEL,
+    NL2SQL_SEMANTIC_THRESHOLD,
+    NL2SQL_SEMANTIC_TTL,
+)
+from data_agent.utils.log import log_step
+
+
+@lru_cache(maxsize=2)
+def _get_embedding_model(name: str) -> Any:
+    from vertexai.language_models import TextEmbeddingModel  # type: ignore
+
+    return TextEmbeddingModel.from_pretrained(name)
+
+
+class SemanticSQLCache:
+    """In-memory cache of generated SQL, matched by cosine similarity of question embeddings.
+
+    Embeddings come from Vertex AI and are compared with numpy; if either is unavailable
+    every lookup is a miss and the caller falls through to SQL generation.
+    """
+
+    def __init__(
+        self,
+        *,
+        threshold: float = NL2SQL_SEMANTIC_THRESHOLD,
+        maxsize: int = 256,
+        ttl: float = NL2SQL_SEMANTIC_TTL,
+        model_name: str = NL2SQL_EMBEDDING_MODEL,
+    ) -> None:
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.model_name = model_name
+        # question -> (unit embedding, sanitized sql, stored_at)
+        self._entries: "OrderedDict[str, Tuple[Any, str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> Optional[Any]:
+        try:
+            import numpy as np  # local import
+
+            values = _get_embedding_model(self.model_name).get_embeddings([text])[0].values
+        except Exception as exc:  # noqa: BLE001
+            log_step(f"Semantic cache disabled for this call: {exc}")
+            return None
+        vec = np.asarray(values, dtype=np.float32)
+        norm = float(np.linalg.norm(vec))
+        return vec / norm if norm else None
+
+    def lookup(self, question: str) -> Tuple[Optional[str], Optional[Any]]:
+        """Return (cached_sql or None, question embedding) so a miss can be stored without re-embedding."""
+        embedding = self._embed(question)
+        if embedding is None:
+            return None, None
+        import numpy as np  # local import
+
+        with self._lock:
+            now = time.monotonic()
+            for key in [k for k, (_, _, ts) in self._entries.items() if now - ts > self.ttl]:
+                del self._entries[key]
+            if not self._entries:
+                return None, embedding
+            keys = list(self._entries)
+            sims = np.stack([e[0] for e in self._entries.values()]) @ embedding
+            best = int(np.argmax(sims))
+            if float(sims[best]) < self.threshold:
+                return None, embedding
+            self._entries.move_to_end(keys[best])
+            return self._entries[keys[best]][1], embedding
+
+    def store(self, question: str, embedding: Any, sql: str) -> None:
+        if embedding is None:
+            return
+        with self._lock:
+            self._entries[question] = (embedding, sql, time.monotonic())
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def evict_sql(self, sql: str) -> None:
+        """Drop every entry that maps to `sql`, e.g. after it failed to execute."""
+        with self._lock:
+            for key in [k for k, (_, cached, _) in self._entries.items() if cached == sql]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,76 @@
+"""Tests for narrowing the nl2py sample to the columns the generated code reads."""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+pytest.importorskip("pandas")
+
+from data_agent.nl2py import _referenced_columns
+
+COLUMNS = ["a", "b", "c", "count", "values", "index"]
+
+
+@pytest.mark.parametrize(
+    "code, expected",
+    [
+        ("result = df['a'].sum()", ["a"]),
+        ("result = df['a'].sum() + df.b.mean()", ["a", "b"]),
+        ("result = df[['a', 'c']].corr()", ["a", "c"]),
+        ("df['z'] = df['a'] * 2\nresult = df['z'].sum()", ["a"]),
+        ("df['a'] += 1\nresult = df['a'].max()", ["a"]),
+        ("result = df['count'].sum()", ["count"]),
+    ],
+)
+def test_narrows_plain_column_access(code, expected):
+    assert _referenced_columns(code, COLUMNS) == expected
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        # DataFrame members that share a column's name
+        "result = df.count()",
+        "result = df.values",
+        "result = df.index",
+        # Whole-frame and positional access
+        "result = df.drop(columns=['a'])",
+        "result = {c: df[c].max() for c in df if c != 'a'}",
+        "result = df['b'].sum() / df.shape[1]",
+        "result = df.iloc[:, 0] + df['b']",
+        "result = df",
+        # Aliasing and rebinding
+        "d = df\nresult = d['a'].sum()",
+        "df = df[df['a'] > 1]",
+        # Unknown attribute and calls on column-named attributes
+        "result = df.a()",
+        "result = df.nope",
+        # Unparseable code
+        "result = (",
+    ],
+)
+def test_keeps_full_sample_otherwise(code):
+    assert _referenced_columns(code, COLUMNS) == []
+
+
+def test_time_budget_stops_code_that_swallows_timeouts(monkeypatch):
+    import threading
+    import time
+
+    from data_agent import nl2py
+
+    monkeypatch.setattr(nl2py, "NL2PY_TIME_BUDGET", 0.3)
+    code = "while True:\n    try:\n        pass\n    except:\n        pass\n"
+    start = time.monotonic()
+    res = nl2py._safe_exec_python(code, [])
+    assert res["status"] == "error"
+    assert "time budget" in res["error_message"]
+    assert time.monotonic() - start < 2
+
+    deadline = time.monotonic() + 5
+    while any(t.name == "nl2py-exec" for t in threading.enumerate()) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert not any(t.name == "nl2py-exec" for t in threading.enumerate())
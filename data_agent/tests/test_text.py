@@ -0,0 +1,27 @@
+"""Tests for picking the code block out of a model response."""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from data_agent.utils.text import extract_code_block
+
+
+def test_strips_language_tag():
+    assert extract_code_block("```sql\nSELECT 1\n```", lang="sql") == "SELECT 1"
+
+
+def test_keyword_on_first_line_is_not_a_tag():
+    text = "```SELECT\n a FROM t```"
+    assert extract_code_block(text, lang="sql", contains="select") == "SELECT\n a FROM t"
+
+
+def test_prefers_sql_block_over_earlier_blocks():
+    text = "```python\nx = 1\n```\nthen\n```\nSELECT 2\n```"
+    assert extract_code_block(text, lang="sql", contains="select") == "SELECT 2"
+
+
+def test_falls_back_to_first_block_then_whole_text():
+    assert extract_code_block("```\nfoo\n```\n```\nbar\n```") == "foo"
+    assert extract_code_block("  SELECT 3  ") == "SELECT 3"
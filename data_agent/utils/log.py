@@ -1,9 +1,10 @@
 import os
 import sys
 
+# Resolved once at import; log_step sits on hot paths (per-table/per-query loops)
+_VERBOSE = os.getenv("DATA_AGENT_VERBOSE", "1") not in {"0", "false", "False"}
+
 
 def log_step(message: str) -> None:
-    if os.getenv("DATA_AGENT_VERBOSE", "1") not in {"0", "false", "False"}:
+    if _VERBOSE:
         print(f"[data_agent] {message}", file=sys.stderr)
-
-
@@ -0,0 +1,37 @@
+import re
+from typing import List, Optional, Tuple
+
+# Fenced blocks; a word alone on the opening line may be a language tag
+_CODE_FENCE = re.compile(r"```([\w+-]*\n)?(.*?)```", re.DOTALL)
+# Only these count as tags, so e.g. "```SELECT\n a FROM t```" keeps its first line
+_LANG_TAGS = frozenset(
+    {"sql", "bigquery", "googlesql", "standardsql", "python", "python3", "py", "json", "text", "bash", "sh"}
+)
+
+
+def _code_blocks(text: str) -> List[Tuple[str, str]]:
+    blocks = []
+    for first_line, body in _CODE_FENCE.findall(text):
+        tag = first_line.strip().lower()
+        if tag in _LANG_TAGS:
+            blocks.append((tag, body.strip()))
+        else:
+            blocks.append(("", (first_line + body).strip()))
+    return blocks
+
+
+def extract_code_block(text: str, lang: Optional[str] = None, contains: Optional[str] = None) -> str:
+    """Pick a fenced block: tagged `lang` first, then one containing `contains`
+    (case-insensitive), then the first block; the whole text if there is none."""
+    blocks = _code_blocks(text)
+    if not blocks:
+        return text.strip()
+    if lang:
+        for tag, body in blocks:
+            if tag == lang:
+                return body
+    if contains:
+        for _, body in blocks:
+            if contains in body.lower():
+                return body
+    return blocks[0][1]
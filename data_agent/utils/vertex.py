@@ -0,0 +1,10 @@
+from functools import lru_cache
+from typing import Any
+
+
+@lru_cache(maxsize=4)
+def get_gen_model(name: str) -> Any:
+    # Model construction sets up auth and the gRPC stub; share one instance per model name.
+    from vertexai.generative_models import GenerativeModel  # type: ignore
+
+    return GenerativeModel(name)
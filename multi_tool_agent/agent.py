@@ -1,8 +1,36 @@
+import asyncio
 import os
+import re
 import datetime
+from functools import cache, partial
+from typing import TYPE_CHECKING, Any, Callable, List
 from zoneinfo import ZoneInfo
-from google.adk.agents import Agent
-from multi_tool_agent.bq_tools import query_bigquery
+from multi_tool_agent.bq_tools import _run_fixed_query, query_bigquery
+from multi_tool_agent.cache import SingleFlight, TTLCache
+
+if TYPE_CHECKING:
+    from google.adk.agents import Agent
+
+# (project_id, location) -> last successful pgduty summary; misses are coalesced
+# so simultaneous /pgduty triggers share one BigQuery job
+_pgduty_cache = TTLCache(maxsize=16, ttl=300)
+_pgduty_flight = SingleFlight()
+
+# Known cities, keyed by lowercase name; lookups replace the per-call if/else chains
+_WEATHER_REPORTS = {
+    "new york": (
+        "The weather in New York is sunny with a temperature of 25 degrees"
+        " Celsius (77 degrees Fahrenheit)."
+    ),
+}
+_CITY_TZ = {"new york": "America/New_York"}
+
+
+@cache
+def _zone(tz_identifier: str) -> ZoneInfo:
+    # Built on first use: a host without tzdata then only fails get_current_time, not the import
+    return ZoneInfo(tz_identifier)
+
 
 def get_weather(city: str) -> dict:
     """Retrieves the current weather report for a specified city.
@@ -13,19 +41,13 @@ def get_weather(city: str) -> dict:
     Returns:
         dict: status and result or error msg.
     """
-    if city.lower() == "new york":
-        return {
-            "status": "success",
-            "report": (
-                "The weather in New York is sunny with a temperature of 25 degrees"
-                " Celsius (77 degrees Fahrenheit)."
-            ),
-        }
-    else:
+    report = _WEATHER_REPORTS.get(city.lower())
+    if report is None:
         return {
             "status": "error",
             "error_message": f"Weather information for '{city}' is not available.",
         }
+    return {"status": "success", "report": report}
 
 
 def get_current_time(city: str) -> dict:
@@ -37,10 +59,8 @@ def get_current_time(city: str) -> dict:
     Returns:
         dict: status and result or error msg.
     """
-
-    if city.lower() == "new york":
-        tz_identifier = "America/New_York"
-    else:
+    tz_identifier = _CITY_TZ.get(city.lower())
+    if tz_identifier is None:
         return {
             "status": "error",
             "error_message": (
@@ -48,37 +68,35 @@ def get_current_time(city: str) -> dict:
             ),
         }
 
-    tz = ZoneInfo(tz_identifier)
-    now = datetime.datetime.now(tz)
+    now = datetime.datetime.now(_zone(tz_identifier))
     report = (
         f'The current time in {city} is {now.strftime("%Y-%m-%d %H:%M:%S %Z%z")}'
     )
     return {"status": "success", "report": report}
 
 
-# BigQuery tool comes from bq_tools; keep the same public name available here
-
-
- 
+# Agents are built on first use (google.adk and model clients are costly to import);
+# get_*_agent() or the module attributes below return the shared instance.
+@cache
+def get_bigquery_agent() -> "Agent":
+    from google.adk.agents import Agent
 
-
-bigquery_agent = Agent(
-    name="bigquery_agent",
-    model="gemini-2.0-flash",
-    description=(
-        "Agent that can answer data questions by running read-only BigQuery queries."
-    ),
-    instruction=(
-        "Use the provided tool to execute safe, read-only SELECT queries against BigQuery. "
-        "Return concise summaries and include sample rows when helpful."
-    ),
-    tools=[query_bigquery],
-)
+    return Agent(
+        name="bigquery_agent",
+        model="gemini-2.0-flash",
+        description=(
+            "Agent that can answer data questions by running read-only BigQuery queries."
+        ),
+        instruction=(
+            "Use the provided tool to execute safe, read-only SELECT queries against BigQuery. "
+            "Return concise summaries and include sample rows when helpful."
+        ),
+        tools=[query_bigquery],
+    )
 
 
-def query_pgduty_summary(project_id: str = "ruckusoperations", location: str = "US") -> dict:
-    sql = (
-        """
+# Constant and known read-only, so it skips query_bigquery's validation entirely
+_PGDUTY_SQL = """
 SELECT
     'Simple Total Alerts Count' as analysis_type,
     COUNT(*) as total_alerts,
@@ -88,53 +106,78 @@ SELECT
     MIN(`Created At America_Los_Angeles`) as earliest_alert,
     MAX(`Created At America_Los_Angeles`) as latest_alert
 FROM `ruckusoperations.SDC1.pgduty`;
-        """
+"""
+
+
+def query_pgduty_summary(project_id: str = "ruckusoperations", location: str = "US") -> dict:
+    key = (project_id, location)
+    hit, cached = _pgduty_cache.get(key)
+    if hit:
+        return dict(cached)
+
+    def load() -> dict:
+        result = _run_fixed_query(_PGDUTY_SQL, project_id=project_id, location=location)
+        if result.get("status") == "success":
+            _pgduty_cache.set(key, result)
+        return result
+
+    return dict(_pgduty_flight.do(key, load))
+
+
+@cache
+def get_pgduty_summary_agent() -> "Agent":
+    from google.adk.agents import Agent
+
+    return Agent(
+        name="pgduty_summary_agent",
+        model="gemini-2.0-flash",
+        description=(
+            "Agent that returns a simple aggregate summary from ruckusoperations.SDC1.pgduty."
+        ),
+        instruction=(
+            "Use the tool to fetch total alerts, unique incidents/services/types, and time range."
+        ),
+        tools=[query_pgduty_summary],
     )
-    return query_bigquery(sql=sql, project_id=project_id, location=location)
 
 
-pgduty_summary_agent = Agent(
-    name="pgduty_summary_agent",
-    model="gemini-2.0-flash",
-    description=(
-        "Agent that returns a simple aggregate summary from ruckusoperations.SDC1.pgduty."
-    ),
-    instruction=(
-        "Use the tool to fetch total alerts, unique incidents/services/types, and time range."
-    ),
-    tools=[query_pgduty_summary],
-)
+@cache
+def get_root_agent() -> "Agent":
+    from google.adk.agents import Agent
 
+    return Agent(
+        name="weather_time_agent",
+        model="gemini-2.0-flash",
+        description=(
+            "Agent that answers city time/weather questions and can run the pgduty summary in BigQuery."
+        ),
+        instruction=(
+            "You can answer city time/weather questions. When the user asks for a pgduty alerts summary, "
+            "call the pgduty summary tool to fetch totals, unique counts, and time range."
+        ),
+        tools=[get_weather, get_current_time, query_pgduty_summary],
+    )
 
-root_agent = Agent(
-    name="weather_time_agent",
-    model="gemini-2.0-flash",
-    description=(
-        "Agent that answers city time/weather questions and can run the pgduty summary in BigQuery."
-    ),
-    instruction=(
-        "You can answer city time/weather questions. When the user asks for a pgduty alerts summary, "
-        "call the pgduty summary tool to fetch totals, unique counts, and time range."
-    ),
-    tools=[get_weather, get_current_time, query_pgduty_summary],
-)
 
+@cache
+def get_router_agent() -> "Agent":
+    from google.adk.agents import Agent
 
-router_agent = Agent(
-    name="router_agent",
-    model="gemini-2.0-flash",
-    description=(
-        "Top-level router that chooses the right sub-agent: weather/time vs BigQuery."
-    ),
-    instruction=(
-        "If the user asks about weather or the current time in a city, use the weather/time tools. "
-        "If the user asks for data analysis, SQL, BigQuery datasets/tables, or metrics, use the BigQuery tool. "
-        "When using BigQuery, generate a safe, read-only SELECT and prefer parameterized queries. "
-        "Summarize results succinctly and include a few sample rows when helpful."
-    ),
-    # Expose tools from both domains so the model can auto-select.
-    tools=[get_weather, get_current_time, query_bigquery, query_pgduty_summary],
-)
+    return Agent(
+        name="router_agent",
+        model="gemini-2.0-flash",
+        description=(
+            "Top-level router that chooses the right sub-agent: weather/time vs BigQuery."
+        ),
+        instruction=(
+            "If the user asks about weather or the current time in a city, use the weather/time tools. "
+            "If the user asks for data analysis, SQL, BigQuery datasets/tables, or metrics, use the BigQuery tool. "
+            "When using BigQuery, generate a safe, read-only SELECT and prefer parameterized queries. "
+            "Summarize results succinctly and include a few sample rows when helpful."
+        ),
+        # Expose tools from both domains so the model can auto-select.
+        tools=[get_weather, get_current_time, query_bigquery, query_pgduty_summary],
+    )
 
 
 # Simple keyword-based router for chat services
@@ -145,20 +188,82 @@ PGDUTY_TRIGGERS = {
     "query pgduty summary",
     "query_pgduty_summary",
 }
+_PGDUTY_LOWER = frozenset(t.lower() for t in PGDUTY_TRIGGERS)
+# Longest first so the alternation reports the most specific trigger
+_PGDUTY_RE = re.compile(
+    "|".join(re.escape(t) for t in sorted(_PGDUTY_LOWER, key=len, reverse=True))
+)
 
 
-def reply(user_message: str) -> str:
-    text = (user_message or "").strip()
-    lowered = text.lower()
+# Cities the weather/time tools know about
+KNOWN_CITIES = tuple(dict.fromkeys([*_WEATHER_REPORTS, *_CITY_TZ]))
+
+
+# Whole words only, so e.g. "sometimes" doesn't trigger the time tool
+_WEATHER_RE = re.compile(r"\bweather\b")
+_TIME_RE = re.compile(r"\btime\b")
 
+_FALLBACK_REPLY = (
+    "Unrecognized request. Use /pgduty or 'pgduty summary' to trigger the pgduty summary, "
+    "ask for the weather or time in New York, or provide a BigQuery SQL query."
+)
+
+
+def _matched_calls(user_message: str) -> List[Callable[[], dict]]:
+    lowered = (user_message or "").strip().lower()
+
+    calls: List[Callable[[], dict]] = []
     # Trigger pgduty summary explicitly by keywords
-    if any(trigger in lowered for trigger in {t.lower() for t in PGDUTY_TRIGGERS}):
+    if _PGDUTY_RE.search(lowered):
         location = os.getenv("BIGQUERY_LOCATION") or "US"
-        result = query_pgduty_summary(project_id="ruckusoperations", location=location)
-        return str(result)
-
-    # Fallback: instruct user how to trigger pgduty or provide SQL
-    return (
-        "Unrecognized request. Use /pgduty or 'pgduty summary' to trigger the pgduty summary, "
-        "or provide a BigQuery SQL query."
-    )
\ No newline at end of file
+        calls.append(partial(query_pgduty_summary, project_id="ruckusoperations", location=location))
+    for city in KNOWN_CITIES:
+        if city in lowered:
+            if _WEATHER_RE.search(lowered):
+                calls.append(partial(get_weather, city))
+            if _TIME_RE.search(lowered):
+                calls.append(partial(get_current_time, city))
+    return calls
+
+
+async def reply_async(user_message: str) -> str:
+    calls = _matched_calls(user_message)
+    if not calls:
+        return _FALLBACK_REPLY
+    if len(calls) == 1:
+        return str(await asyncio.to_thread(calls[0]))
+    # Tools are independent and blocking; run them concurrently so the reply
+    # waits for the slowest call rather than the sum of all of them.
+    results = await asyncio.gather(*(asyncio.to_thread(call) for call in calls))
+    return "\n".join(str(result) for result in results)
+
+
+def reply(user_message: str) -> str:
+    """Sync entry point for chat services."""
+    calls = _matched_calls(user_message)
+    if not calls:
+        return _FALLBACK_REPLY
+    if len(calls) == 1:
+        return str(calls[0]())
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(reply_async(user_message))
+    # Inside a running event loop asyncio.run() is unavailable; run the tools in turn
+    return "\n".join(str(call()) for call in calls)
+
+
+_AGENT_BUILDERS = {
+    "bigquery_agent": get_bigquery_agent,
+    "pgduty_summary_agent": get_pgduty_summary_agent,
+    "root_agent": get_root_agent,
+    "router_agent": get_router_agent,
+}
+
+
+def __getattr__(name: str) -> Any:
+    # PEP 562: keeps `agent.root_agent` (used by ADK discovery) and friends working
+    builder = _AGENT_BUILDERS.get(name)
+    if builder is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return builder()
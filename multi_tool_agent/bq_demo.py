@@ -13,6 +13,34 @@ except ModuleNotFoundError:
     sys.path.append(str(Path(__file__).resolve().parents[1]))
     from multi_tool_agent.bq_tools import query_bigquery
 
+try:
+    import orjson  # type: ignore
+except ImportError:
+    orjson = None  # type: ignore
+
+
+def _write_json(obj: Any) -> None:
+    # orjson is optional and faster. query_bigquery already returns JSON-native values;
+    # anything orjson still rejects (e.g. integers beyond 64 bits) falls back to json.
+    if orjson is not None:
+        try:
+            data = orjson.dumps(
+                obj,
+                option=orjson.OPT_INDENT_2
+                | orjson.OPT_NON_STR_KEYS
+                | orjson.OPT_SERIALIZE_NUMPY
+                | orjson.OPT_APPEND_NEWLINE,
+                default=str,
+            )
+        except orjson.JSONEncodeError:
+            pass
+        else:
+            # Bytes straight to the binary buffer, skipping the text encoder layer
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+            return
+    print(json.dumps(obj, ensure_ascii=False, indent=2, default=str))
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(
@@ -74,7 +102,7 @@ def main() -> None:
         maximum_rows=args.max_rows,
     )
 
-    print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+    _write_json(result)
 
 
 if __name__ == "__main__":
@@ -1,7 +1,340 @@
+import atexit
+import base64
+import importlib.util
+import inspect
 import os
-from typing import Any, Dict, List, Optional
+import re
+from functools import cache, lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Hashable, List, Literal, Optional, Tuple
 
-from google.cloud import bigquery
+from multi_tool_agent.cache import SingleFlight, TTLCache
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+
+@cache
+def _bq_module() -> Any:
+    # Deferred so importing this module (e.g. for weather/time-only agents) stays cheap
+    from google.cloud import bigquery
+
+    return bigquery
+
+
+# Literals, quoted identifiers and comments are kept verbatim; other whitespace runs collapse
+_SQL_ATOM_OR_SPACE = re.compile(
+    r"('''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\])*'|\"(?:\\.|[^\"\\])*\"|`[^`]*`"
+    r"|--[^\n]*\n?|#[^\n]*\n?|/\*.*?\*/)|\s+",
+    re.DOTALL,
+)
+
+
+def _normalize_sql(sql: str) -> str:
+    """Collapse insignificant whitespace so trivially different SQL hits BigQuery's cache."""
+    return _SQL_ATOM_OR_SPACE.sub(
+        lambda m: m.group(1) if m.group(1) is not None else " ", sql.strip()
+    )
+
+
+# Exact-type lookup; bool is its own key, so it never falls through to INT64
+_BQ_TYPE_MAP = {bool: "BOOL", int: "INT64", float: "FLOAT64", str: "STRING", bytes: "BYTES"}
+
+_clients: List["bigquery.Client"] = []
+
+
+@cache
+def _default_job_config() -> "bigquery.QueryJobConfig":
+    # Shared by parameterless queries; the client copies it into each request, never mutates it.
+    return _bq_module().QueryJobConfig(use_query_cache=True)
+
+# Opt-in result cache for query_bigquery(cache_ttl=...), fronted by single-flight
+_result_cache = TTLCache(maxsize=256)
+_query_flight = SingleFlight()
+
+
+# HTTP pool for the shared client: ADK may run several tool calls on worker threads at once,
+# and requests' default of 10 connections per host would make the extra calls wait or reconnect.
+_HTTP_POOL_CONNECTIONS = 16
+_HTTP_POOL_MAXSIZE = 32
+
+
+def _pooled_http(scopes: Tuple[str, ...]) -> Optional[Tuple[Any, Any, Optional[str]]]:
+    """(pooled AuthorizedSession, ADC credentials, ADC project), or None to use client defaults."""
+    try:
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+        from requests.adapters import HTTPAdapter
+
+        credentials, adc_project = google.auth.default(scopes=scopes)
+    except Exception:  # noqa: BLE001 - fall back to the client's default transport
+        return None
+    session = AuthorizedSession(credentials)
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=_HTTP_POOL_CONNECTIONS,
+            pool_maxsize=_HTTP_POOL_MAXSIZE,
+            pool_block=False,
+        ),
+    )
+    return session, credentials, adc_project
+
+
+@lru_cache(maxsize=8)
+def _get_client(project_id: Optional[str]) -> "bigquery.Client":
+    # Client construction runs ADC auth and sets up the HTTP session; reuse it per project.
+    bigquery = _bq_module()
+    kwargs: Dict[str, Any] = {"project": project_id}
+    pooled = _pooled_http(tuple(bigquery.Client.SCOPE))
+    if pooled is not None:
+        # Reuse the ADC result so the client doesn't resolve credentials/project again,
+        # and the session and client share one credentials object.
+        session, credentials, adc_project = pooled
+        kwargs.update(project=project_id or adc_project, credentials=credentials, _http=session)
+    if "default_job_creation_mode" in inspect.signature(bigquery.Client).parameters:
+        # Short queries via query_and_wait may then skip job creation entirely (no job_id)
+        kwargs["default_job_creation_mode"] = "JOB_CREATION_OPTIONAL"
+    client = bigquery.Client(**kwargs)
+    _clients.append(client)
+    return client
+
+
+@atexit.register
+def _close_clients() -> None:
+    for client in _clients:
+        try:
+            client.close()
+        except Exception:  # noqa: BLE001 - best effort at interpreter shutdown
+            pass
+
+
+# Below this many rows a Storage Read API session costs more than paging over REST
+_STORAGE_MIN_ROWS = 10_000
+_HAVE_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+@cache
+def _get_bqstorage_client() -> Optional[Any]:
+    # gRPC channel setup is expensive; one read client serves every project
+    try:
+        from google.cloud import bigquery_storage
+
+        return bigquery_storage.BigQueryReadClient()
+    except Exception:  # noqa: BLE001 - google-cloud-bigquery-storage is optional
+        return None
+
+
+def _storage_table(
+    client: "bigquery.Client",
+    job_id: str,
+    location: Optional[str],
+    bqstorage_client: Any,
+    max_rows: Optional[int],
+) -> Optional[Any]:
+    """Read the job's results over the Storage Read API, stopping after max_rows; None on failure."""
+    try:
+        import pyarrow
+
+        # A fresh, uncapped iterator: the client ignores the Storage API when max_results is set
+        rows = client.get_job(job_id, location=location).result()
+        batches = []
+        remaining = max_rows
+        for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+            if remaining is not None and batch.num_rows >= remaining:
+                batches.append(batch.slice(0, remaining))
+                break
+            batches.append(batch)
+            if remaining is not None:
+                remaining -= batch.num_rows
+        return pyarrow.Table.from_batches(batches)
+    except Exception:  # noqa: BLE001 - pyarrow / bigquery-storage are optional
+        return None
+
+
+def _iso(value: Any) -> str:
+    return value.isoformat()
+
+
+def _b64(value: bytes) -> str:
+    return base64.b64encode(value).decode("ascii")
+
+
+# BigQuery types whose Python values the json encoder can't handle natively
+_JSON_CONVERTERS = {
+    "TIMESTAMP": _iso,
+    "DATETIME": _iso,
+    "DATE": _iso,
+    "TIME": _iso,
+    # str, not float: NUMERIC holds up to 38 digits (money) and float would round them
+    "NUMERIC": str,
+    "BIGNUMERIC": str,
+    "BYTES": _b64,
+}
+
+
+def _repeated(conv: Any) -> Any:
+    return lambda values: [None if v is None else conv(v) for v in values]
+
+
+def _record(fields: List[Tuple[str, Any]]) -> Any:
+    def convert(record: Dict[str, Any]) -> Dict[str, Any]:
+        out = dict(record)
+        for name, conv in fields:
+            value = out.get(name)
+            if value is not None:
+                out[name] = conv(value)
+        return out
+
+    return convert
+
+
+def _field_converter(field: Any) -> Optional[Any]:
+    """JSON converter for a schema field (recursing into RECORD/STRUCT), or None if not needed."""
+    if field.field_type in ("RECORD", "STRUCT"):
+        nested = [(f.name, c) for f in field.fields for c in (_field_converter(f),) if c is not None]
+        conv = _record(nested) if nested else None
+    else:
+        conv = _JSON_CONVERTERS.get(field.field_type)
+    if conv is not None and getattr(field, "mode", None) == "REPEATED":
+        conv = _repeated(conv)
+    return conv
+
+
+def _execute(
+    client: "bigquery.Client",
+    sql: str,
+    job_config: "bigquery.QueryJobConfig",
+    location: Optional[str],
+    max_results: Optional[int],
+) -> Tuple[Any, Optional[str]]:
+    """Run the query and return (row iterator, job id)."""
+    if hasattr(client, "query_and_wait"):
+        # jobs.query fast path (google-cloud-bigquery >= 3.14): no separate insert + poll
+        result = client.query_and_wait(
+            sql, job_config=job_config, location=location, max_results=max_results
+        )
+        return result, getattr(result, "job_id", None)
+    query_job = client.query(sql, job_config=job_config, location=location)
+    return query_job.result(max_results=max_results), query_job.job_id
+
+
+def _result_cache_key(
+    sql: str,
+    project_id: Optional[str],
+    location: Optional[str],
+    parameters: Optional[Dict[str, Any]],
+    maximum_rows: int,
+    return_format: str,
+) -> Optional[Hashable]:
+    key = (
+        sql,
+        project_id,
+        location,
+        frozenset(parameters.items()) if parameters else None,
+        maximum_rows,
+        return_format,
+    )
+    try:
+        hash(key)
+    except TypeError:
+        # Unhashable parameter values (lists, dicts) are simply not cached
+        return None
+    return key
+
+
+def _run_query(
+    sql: str,
+    project_id: Optional[str],
+    location: Optional[str],
+    job_config: "bigquery.QueryJobConfig",
+    maximum_rows: Optional[int],
+    return_format: str = "rows",
+) -> Dict[str, Any]:
+    """Execute validated SQL and build the success response; raises on BigQuery errors."""
+    client = _get_client(project_id)
+    # Stop paging server-side once maximum_rows rows have been fetched
+    max_results = maximum_rows if maximum_rows is not None and maximum_rows > 0 else None
+    result, job_id = _execute(client, sql, job_config, location, max_results)
+
+    arrow_table = None
+    # Arrow only pays off through the Storage Read API: over REST, to_arrow() re-wraps values
+    # the client already parsed and to_pylist() rebuilds them, which loses to the loop below.
+    # Storage reads need the job's destination table, so a job-less (short) query never qualifies.
+    total_rows = getattr(result, "total_rows", None)
+    if (
+        _HAVE_PYARROW
+        and job_id is not None
+        and total_rows is not None
+        and min(total_rows, max_results or total_rows) >= _STORAGE_MIN_ROWS
+    ):
+        bqstorage_client = _get_bqstorage_client()
+        if bqstorage_client is not None:
+            # On failure `result` is still unread, so the REST loop below takes over
+            arrow_table = _storage_table(client, job_id, location, bqstorage_client, max_results)
+
+    # One pass over the schema fields for names, the response schema and JSON converters
+    field_names: List[str] = []
+    schema: List[Dict[str, Any]] = []
+    converters: List[Tuple[str, Any]] = []
+    for field in result.schema:
+        name, field_type, mode = field.name, field.field_type, getattr(field, "mode", None)
+        field_names.append(name)
+        schema.append({"name": name, "type": field_type, "mode": mode})
+        conv = _field_converter(field)
+        if conv is not None:
+            converters.append((name, conv))
+
+    columnar = return_format == "columns"
+    if arrow_table is not None:
+        data = arrow_table.to_pydict() if columnar else arrow_table.to_pylist()
+        num_rows = arrow_table.num_rows
+    elif columnar:
+        # Transpose row tuples into one list per column
+        cols = list(zip(*(row.values() for row in result))) or [()] * len(field_names)
+        data = {name: list(col) for name, col in zip(field_names, cols)}
+        num_rows = len(cols[0]) if cols else 0
+    else:
+        # Row.values() is the underlying tuple, so zip pairs names and values in C
+        data = [dict(zip(field_names, row.values())) for row in result]
+        num_rows = len(data)
+
+    # Convert only the affected columns, so json.dumps never needs a default= fallback
+    for name, conv in converters:
+        if columnar:
+            data[name] = [None if v is None else conv(v) for v in data[name]]
+        else:
+            for row in data:
+                value = row[name]
+                if value is not None:
+                    row[name] = conv(value)
+
+    return {
+        "status": "success",
+        "columns" if columnar else "rows": data,
+        "num_rows": num_rows,
+        "schema": schema,
+        "job_id": job_id,
+    }
+
+
+def _run_fixed_query(
+    sql: str,
+    job_config: Optional["bigquery.QueryJobConfig"] = None,
+    project_id: Optional[str] = None,
+    location: Optional[str] = None,
+    maximum_rows: int = 1000,
+) -> dict:
+    """Run trusted, constant SQL without query_bigquery's validation and parameter handling."""
+    try:
+        return _run_query(
+            sql,
+            project_id or os.getenv("GOOGLE_CLOUD_PROJECT"),
+            location,
+            job_config or _default_job_config(),
+            maximum_rows,
+        )
+    except Exception as exc:  # noqa: BLE001 - surface runtime errors
+        return {"status": "error", "error_message": str(exc)}
 
 
 def query_bigquery(
@@ -10,6 +343,10 @@ def query_bigquery(
     location: Optional[str] = None,
     parameters: Optional[Dict[str, Any]] = None,
     maximum_rows: int = 1000,
+    cache_ttl: Optional[int] = None,
+    use_query_cache: bool = True,
+    dry_run: bool = False,
+    return_format: Literal["rows", "columns"] = "rows",
 ) -> dict:
     """Run a read-only BigQuery SQL and return rows as a list of dicts.
 
@@ -19,9 +356,17 @@ def query_bigquery(
         location: Optional BigQuery location (e.g., "US", "EU").
         parameters: Optional dict of named query parameters.
         maximum_rows: Max number of rows to return for safety.
+        cache_ttl: Optional seconds to reuse an identical successful result.
+        use_query_cache: Let BigQuery serve identical SQL from its result cache.
+        dry_run: Only validate the query and estimate bytes processed (never cached).
+        return_format: "rows" for a list of dicts, "columns" for a dict of column lists.
 
     Returns:
-        dict: status, rows, schema, num_rows or error.
+        dict: status, rows (or columns), schema, num_rows or error
+        (bytes_processed for dry runs). TIMESTAMP/DATETIME/DATE/TIME values are
+        ISO-8601 strings, NUMERIC/BIGNUMERIC exact decimal strings and BYTES
+        base64 strings, including fields nested in RECORD/STRUCT columns.
+        job_id is None when BigQuery answered without creating a job.
     """
     try:
         if not isinstance(sql, str) or not sql.strip():
@@ -30,62 +375,66 @@ def query_bigquery(
                 "error_message": "SQL must be a non-empty string.",
             }
 
-        lowered = sql.strip().lower()
-        if not lowered.startswith("select"):
+        # Only the prefix matters; don't lowercase a copy of the whole (possibly large) SQL
+        stripped = sql.lstrip()
+        if stripped[:6].lower() != "select":
             return {
                 "status": "error",
                 "error_message": "Only read-only SELECT queries are allowed.",
             }
 
+        sql = _normalize_sql(sql)
         effective_project = project_id or os.getenv("GOOGLE_CLOUD_PROJECT")
-        client = bigquery.Client(project=effective_project)
-
-        job_config = bigquery.QueryJobConfig()
-
-        if parameters:
-            query_parameters: List[bigquery.ScalarQueryParameter] = []
-            for name, value in parameters.items():
-                if isinstance(value, bool):
-                    bq_type = "BOOL"
-                elif isinstance(value, int):
-                    bq_type = "INT64"
-                elif isinstance(value, float):
-                    bq_type = "FLOAT64"
-                else:
-                    bq_type = "STRING"
-                query_parameters.append(
-                    bigquery.ScalarQueryParameter(name, bq_type, value)
-                )
-            job_config.query_parameters = query_parameters
-
-        query_job = client.query(sql, job_config=job_config, location=location)
-        result = query_job.result()
-
-        rows: List[Dict[str, Any]] = []
-        field_names = [field.name for field in result.schema]
-        for row in result:
-            row_dict = {field_name: row[field_name] for field_name in field_names}
-            rows.append(row_dict)
-
-        if maximum_rows is not None and maximum_rows > 0:
-            rows = rows[:maximum_rows]
-
-        schema = [
-            {
-                "name": field.name,
-                "type": field.field_type,
-                "mode": getattr(field, "mode", None),
+
+        cache_key = None
+        if cache_ttl and use_query_cache and not dry_run:
+            cache_key = _result_cache_key(
+                sql, effective_project, location, parameters, maximum_rows, return_format
+            )
+            if cache_key is not None:
+                hit, cached = _result_cache.get(cache_key)
+                if hit:
+                    return dict(cached)
+
+        if parameters or dry_run or not use_query_cache:
+            bigquery = _bq_module()
+            # A dry run must not hit the cache, or the byte estimate would be for a cache hit
+            job_config = bigquery.QueryJobConfig(
+                use_query_cache=use_query_cache and not dry_run, dry_run=dry_run
+            )
+            if parameters:
+                job_config.query_parameters = [
+                    bigquery.ScalarQueryParameter(
+                        name, _BQ_TYPE_MAP.get(type(value), "STRING"), value
+                    )
+                    for name, value in parameters.items()
+                ]
+        else:
+            job_config = _default_job_config()
+
+        if dry_run:
+            client = _get_client(effective_project)
+            query_job = client.query(sql, job_config=job_config, location=location)
+            return {
+                "status": "success",
+                "dry_run": True,
+                "bytes_processed": query_job.total_bytes_processed,
             }
-            for field in result.schema
-        ]
-
-        return {
-            "status": "success",
-            "rows": rows,
-            "num_rows": len(rows),
-            "schema": schema,
-            "job_id": query_job.job_id,
-        }
+
+        if cache_key is None:
+            return _run_query(
+                sql, effective_project, location, job_config, maximum_rows, return_format
+            )
+
+        def load() -> Dict[str, Any]:
+            response = _run_query(
+                sql, effective_project, location, job_config, maximum_rows, return_format
+            )
+            _result_cache.set(cache_key, response, ttl=cache_ttl)
+            return response
+
+        # Concurrent identical calls share one BigQuery job instead of each issuing their own
+        return dict(_query_flight.do(cache_key, load))
     except Exception as exc:  # noqa: BLE001 - surface runtime errors
         return {"status": "error", "error_message": str(exc)}
 